@@ -1,35 +1,111 @@
 import gradio as gr
 import requests
-import warnings
-import pandas as pd
+import certifi
 import os
+import shutil
 import yaml
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from diskcache import Cache
+from functools import lru_cache
+from operator import itemgetter
 from tempfile import _TemporaryFileWrapper
+from typing import TYPE_CHECKING
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-warnings.filterwarnings("ignore")
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
+if TYPE_CHECKING:
+    import pandas as pd
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+_SESSION = requests.Session()
+_SESSION.verify = certifi.where()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
+    ),
+)
+
+# On-chain package lists only change on upgrade, so a short TTL is enough
+_RESOURCE_CACHE = Cache(".cache/resources")
+RESOURCE_CACHE_TTL = 60
+
+_name = itemgetter("name")
+
+
+@_RESOURCE_CACHE.memoize(expire=RESOURCE_CACHE_TTL)
 def get_onchain_modules(
     endpoint: str,
     registry: str,
     contract: str,
 ):
-    resp = requests.get(f"{endpoint}/accounts/{contract}/resources", verify=False)
-    payload = resp.json()
-    packages = []
-    for entry in payload:
-        if entry["type"] != registry:
-            continue
-        for pkg in entry.get("data", {}).get("packages", []):
-            packages.append(
-                {
-                    "package": pkg["name"],
-                    "modules": set(x["name"] for x in pkg["modules"]),
-                    "version": pkg["upgrade_number"],
-                }
+    resp = _SESSION.get(f"{endpoint}/accounts/{contract}/resources", timeout=(3, 10))
+    resp.raise_for_status()
+    payload = json_loads(resp.content)
+    return [
+        {
+            "package": pkg["name"],
+            "modules": frozenset(map(_name, pkg["modules"])),
+            "version": pkg["upgrade_number"],
+        }
+        for entry in payload
+        if entry["type"] == registry
+        for pkg in entry.get("data", {}).get("packages", ())
+    ]
+
+
+def get_onchain_modules_batch(
+    endpoint: str,
+    registry: str,
+    contracts: list[str],
+) -> list[list[dict]]:
+    if len(contracts) <= 1:
+        return [get_onchain_modules(endpoint, registry, contract) for contract in contracts]
+    # Requests share the pooled session, so keep the worker count within the pool size
+    with ThreadPoolExecutor(max_workers=min(len(contracts), 16)) as executor:
+        return list(
+            executor.map(
+                lambda contract: get_onchain_modules(endpoint, registry, contract),
+                contracts,
             )
-    return packages
+        )
+
+
+@lru_cache(maxsize=8)
+def _compile_spec(spec_str: str) -> dict[str, dict] | None:
+    spec: dict = yaml.load(spec_str, Loader=SafeLoader)
+    approved_specs = spec.get("aptos_defi_approved_lists", None)
+    if not approved_specs:
+        return None
+
+    # The index is shared between calls through the cache, treat it as read-only
+    index = {}
+    for contract in approved_specs:
+        for pkg in contract["packages"]:
+            # First entry wins when a package name appears more than once
+            if pkg["name"] not in index:
+                index[pkg["name"]] = {
+                    "name": pkg["name"],
+                    "approved_str": ", ".join(pkg["approved"]),
+                    "_modules_fs": frozenset(pkg["modules"]),
+                    "_approved_set": frozenset(str(v).lstrip("v") for v in pkg["approved"]),
+                }
+    return index
 
 
 def handle_analyze(
@@ -37,8 +113,13 @@ def handle_analyze(
     registry: str,
     contract_address: str,
     spec_str: str,
-) -> tuple[pd.DataFrame | None, list]:
-    if not contract_address:
+) -> tuple["pd.DataFrame | None", list]:
+    # Deferred so the server comes up without paying for pandas/NumPy until the first analysis
+    import numpy as np
+    import pandas as pd
+
+    contracts = [x.strip() for x in contract_address.split(",") if x.strip()]
+    if not contracts:
         gr.Warning("Please fill in contract address")
         return None, []
 
@@ -46,66 +127,83 @@ def handle_analyze(
         gr.Warning("Please fill in spec")
         return None, []
 
-    onchain_data = get_onchain_modules(endpoint, registry, contract_address)
-
-    spec: dict = yaml.safe_load(spec_str)
-    approved_specs = spec.get("aptos_defi_approved_lists", None)
-    if not approved_specs:
+    approved_index = _compile_spec(spec_str)
+    if not approved_index:
         gr.Warning("Please fill in approved list in spec")
         return None, []
 
-    rows = []
-
-    for runtime_pkg in onchain_data:
-        matched_pkg = next(
-            (
-                pkg
-                for contract in approved_specs
-                for pkg in contract["packages"]
-                if pkg["name"] == runtime_pkg["package"]
-            ),
-            None,
-        )
-
-        if matched_pkg:
-            is_version_approved = f"v{runtime_pkg['version']}" in matched_pkg["approved"]
-            is_modules_match = set(runtime_pkg["modules"]) == set(matched_pkg["modules"])
-            matched = is_version_approved and is_modules_match
-        else:
-            matched = False
-
-        contract_name = matched_pkg["name"] if matched_pkg else "Unknown"
-        approved_versions_str = ", ".join(matched_pkg["approved"]) if matched_pkg else "N/A"
-
-        rows.append(
-            {
-                "package name": runtime_pkg["package"],
-                "contract name": contract_name,
-                "address": contract_address,
-                "onchain package version": f"v{runtime_pkg['version']}",
-                "approved versions": approved_versions_str,
-                "matched": "✅" if matched else "❌",
-            }
+    onchain_data = [
+        {"address": contract, **pkg}
+        for contract, packages in zip(
+            contracts, get_onchain_modules_batch(endpoint, registry, contracts)
         )
-
-    df = pd.DataFrame(rows)
-    df = df.sort_values(by=["matched"], ascending=False)
-
-    return df, onchain_data
+        for pkg in packages
+    ]
+
+    pkg_names = [runtime_pkg["package"] for runtime_pkg in onchain_data]
+    addresses = [runtime_pkg["address"] for runtime_pkg in onchain_data]
+    versions = [runtime_pkg["version"] for runtime_pkg in onchain_data]
+
+    if approved_index.keys().isdisjoint(pkg_names):
+        # Nothing on-chain is covered by the spec, every package is unknown
+        contract_names = ["Unknown"] * len(pkg_names)
+        approved_versions = ["N/A"] * len(pkg_names)
+        matched_flags = [False] * len(pkg_names)
+    else:
+        contract_names = []
+        approved_versions = []
+        matched_flags = []
+
+        for runtime_pkg in onchain_data:
+            matched_pkg = approved_index.get(runtime_pkg["package"])
+
+            if matched_pkg:
+                is_version_approved = str(runtime_pkg["version"]) in matched_pkg["_approved_set"]
+                is_modules_match = runtime_pkg["modules"] == matched_pkg["_modules_fs"]
+                matched = is_version_approved and is_modules_match
+            else:
+                matched = False
+
+            contract_names.append(matched_pkg["name"] if matched_pkg else "Unknown")
+            approved_versions.append(matched_pkg["approved_str"] if matched_pkg else "N/A")
+            matched_flags.append(matched)
+
+    matched_arr = np.asarray(matched_flags, dtype=bool)
+    # Unmatched packages first, keeping on-chain order within each group
+    order = np.argsort(matched_arr, kind="stable")
+    columns = {
+        "package name": pkg_names,
+        "contract name": contract_names,
+        "address": addresses,
+        "onchain package version": np.char.add("v", np.asarray(versions, dtype=str)),
+        "approved versions": approved_versions,
+        "matched": np.where(matched_arr, "✅", "❌"),
+    }
+    df = pd.DataFrame({name: np.asarray(col, dtype=object)[order] for name, col in columns.items()})
+
+    # Module sets are not JSON serializable, hand the raw view sorted lists instead
+    return df, [{**pkg, "modules": sorted(pkg["modules"])} for pkg in onchain_data]
+
+
+_spec_cache: set[str] | None = None
+_spec_contents: dict[str, str] = {}
+
+
+def _list_specs() -> list[str]:
+    global _spec_cache
+    if _spec_cache is None:
+        with os.scandir("specs") as entries:
+            _spec_cache = {e.name for e in entries if e.is_file() and e.name.endswith(".yaml")}
+    return sorted(_spec_cache)
 
 
 def handle_upload_spec(fileobj: _TemporaryFileWrapper):
     try:
-        # Get file content
-        with open(fileobj.name, "rb") as f:
-            content = f.read()
         # Check filename
         basename = os.path.basename(fileobj.name)
 
         def refresh_specs() -> list:
-            spec_files = set(os.listdir("specs"))
-            spec_files.add(basename)
-            return gr.Dropdown.update(choices=spec_files)
+            return gr.Dropdown.update(choices=_list_specs())
 
         if basename == "example.yaml":
             gr.Warning("Please upload a spec file with different name")
@@ -115,21 +213,33 @@ def handle_upload_spec(fileobj: _TemporaryFileWrapper):
             gr.Warning("Please upload a spec file with .yaml extension")
             return None, refresh_specs()
         # Save file
-        with open(f"specs/{basename}", "wb") as f:
-            f.write(content)
+        shutil.copyfile(fileobj.name, f"specs/{basename}")
+        # A cache that was never populated will pick the file up on the next scan
+        if _spec_cache is not None:
+            _spec_cache.add(basename)
+        _spec_contents.pop(basename, None)
         return f"specs/{basename}", refresh_specs()
     except Exception as e:
         gr.Warning(f"Failed to upload spec: {e}")
         print(e)
-        return None, os.listdir("specs")
+        return None, _list_specs()
+
+
+def _read_spec(name: str) -> str:
+    content = _spec_contents.get(name)
+    if content is None:
+        with open(f"specs/{name}", "r", encoding="utf-8") as f:
+            content = f.read()
+        _spec_contents[name] = content
+    return content
 
 
 def handle_select_spec(dropdown_spec: str) -> str:
-    return open(f"specs/{dropdown_spec}").read()
+    return _read_spec(dropdown_spec)
 
 
 def handle_refresh_specs() -> list:
-    return os.listdir("specs")
+    return _list_specs()
 
 
 def get_parser() -> ArgumentParser:
@@ -137,6 +247,8 @@ def get_parser() -> ArgumentParser:
     parser.add_argument("--host", type=str, default="localhost")
     parser.add_argument("--port", type=int, default=7860)
     parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--concurrency-count", type=int, default=8)
+    parser.add_argument("--max-queue-size", type=int, default=32)
     return parser
 
 
@@ -166,12 +278,12 @@ if __name__ == "__main__":
         lines=1,
         max_lines=1,
         label="Contract Address",
-        placeholder="0x...",
+        placeholder="0x..., 0x...",
         interactive=True,
     )
 
     spec = gr.Code(
-        value=open("specs/example.yaml").read() if os.path.exists("specs/example.yaml") else None,
+        value=_read_spec("example.yaml") if os.path.exists("specs/example.yaml") else None,
         language="yaml",
         interactive=True,
     )
@@ -219,7 +331,7 @@ if __name__ == "__main__":
                 with gr.Column():
                     dropdown_spec = gr.Dropdown(
                         value="example.yaml",
-                        choices=os.listdir("specs"),
+                        choices=_list_specs(),
                         label="Spec File",
                     )
                     dropdown_spec.select(
@@ -242,5 +354,6 @@ if __name__ == "__main__":
             dropdown_endpoint.render()
             dropdown_registry.render()
 
-    demo.queue()
+    # Handlers are sync and run on Gradio's worker threads, so this bounds in-flight fetches
+    demo.queue(concurrency_count=args.concurrency_count, max_size=args.max_queue_size)
     demo.launch(server_name=args.host, server_port=args.port, debug=args.debug)